@@ -1,5 +1,9 @@
+import ctypes
+import ctypes.util
 import socket
 import struct
+import sys
+import threading
 
 # =========================
 # Protocol Constants
@@ -14,6 +18,128 @@ UDP_PORT = 13122
 # Team name sent to the server when accepting an offer
 TEAM_NAME = "badaboom_sapir_batel"
 
+# Encoded team name, used for byte-level comparison against offered server names
+_TEAM_NAME_TRIM = TEAM_NAME.encode()
+
+# Team name field of the request packet, null-padded to 32 bytes
+_TEAM_NAME_BYTES = _TEAM_NAME_TRIM.ljust(32, b'\x00')
+
+# =========================
+# Packet Formats
+# =========================
+
+# Pre-compiled packet layouts, so the format strings are parsed only once
+
+# Offer: magic cookie | message type | TCP port | server name
+_OFFER = struct.Struct('!IBH32s')
+
+# Request: magic cookie | message type | number of rounds | team name
+_REQ = struct.Struct('!IBB32s')
+
+# Server payload: magic cookie | message type | round result | card rank | card suit
+_MSG = struct.Struct('!IBBHB')
+
+# Client payload: magic cookie | message type | decision
+_DEC = struct.Struct('!IB5s')
+
+# Expected first 5 bytes of every server payload: magic cookie | message type
+_MSG_HEADER = struct.pack('!IB', MAGIC_COOKIE, 0x4)
+
+# Receive buffer for game messages, allocated once and reused by every session
+# (sessions run one at a time, so no locking is needed)
+_RECV_BUF = bytearray(1024)
+_RECV_MV = memoryview(_RECV_BUF)
+
+# Kernel receive timeout for the game socket, 10 seconds
+# (a struct timeval, or a DWORD of milliseconds on Windows)
+_RECV_TIMEOUT = struct.pack('@L', 10000) if sys.platform == "win32" else struct.pack('@ll', 10, 0)
+
+# The only two decision packets a player can send, packed once up front
+_HIT_PKT = _DEC.pack(MAGIC_COOKIE, 0x4, b"Hittt")
+_STAND_PKT = _DEC.pack(MAGIC_COOKIE, 0x4, b"Stand")
+
+# Every decision packet, keyed by what the player types. "H<N>" asks the server
+# to deal up to N cards in one go, stopping once the hand reaches 17 or more.
+_DECISION_PKTS = {'h': _HIT_PKT, 's': _STAND_PKT}
+_DECISION_PKTS.update({f'h{n}': _DEC.pack(MAGIC_COOKIE, 0x4, b"H%d" % n) for n in range(2, 10)})
+
+# =========================
+# Batched Offer Receive
+# =========================
+
+# Maximum number of offer datagrams consumed by a single receive call
+_BATCH_SIZE = 16
+
+# Maximum size of a single offer datagram
+_DATAGRAM_SIZE = 1024
+
+# recvmmsg(2) flag: block for the first datagram, then take whatever else is queued
+_MSG_WAITFORONE = 0x10000
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_ubyte * 4),
+        ("sin_zero", ctypes.c_ubyte * 8)
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int)
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    """
+    Looks up recvmmsg(2) in the C library.
+    Returns None on platforms where it is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        return libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+
+
+_recvmmsg = _load_recvmmsg()
+
+# Receive buffer for single-datagram reads, allocated once and reused
+_udp_buf = bytearray(_DATAGRAM_SIZE)
+_udp_mv = memoryview(_udp_buf)
+
+# Receive buffers, addresses and message headers, allocated once and reused
+_batch_bufs = [ctypes.create_string_buffer(_DATAGRAM_SIZE) for _ in range(_BATCH_SIZE)]
+_batch_views = [memoryview(buf).cast('B') for buf in _batch_bufs]
+_batch_addrs = (_SockAddrIn * _BATCH_SIZE)()
+_batch_iovs = (_IOVec * _BATCH_SIZE)()
+_batch_msgs = (_MMsgHdr * _BATCH_SIZE)()
+
+for _i in range(_BATCH_SIZE):
+    _batch_iovs[_i].iov_base = ctypes.cast(_batch_bufs[_i], ctypes.c_void_p)
+    _batch_iovs[_i].iov_len = _DATAGRAM_SIZE
+    _batch_msgs[_i].msg_hdr.msg_name = ctypes.addressof(_batch_addrs[_i])
+    _batch_msgs[_i].msg_hdr.msg_iov = ctypes.pointer(_batch_iovs[_i])
+    _batch_msgs[_i].msg_hdr.msg_iovlen = 1
+
 # =========================
 # Card Display Helpers
 # =========================
@@ -26,6 +152,12 @@ RANK_NAMES = {
     13: "King (10 pts)"
 }
 
+# Display names for every rank, indexed directly by rank (index 0 is unused)
+_RANKS = tuple(RANK_NAMES.get(rank, str(rank)) for rank in range(14))
+
+# Round result names, indexed directly by result code (index 0 is the fallback)
+_OUTCOMES = ("Round Over", "TIE", "LOSS", "WIN")
+
 # Unicode symbols for card suits
 SUIT_ICONS = {
     0: "Hearts ❤️",
@@ -34,6 +166,9 @@ SUIT_ICONS = {
     3: "Spades ♠️"
 }
 
+# Suit symbols, indexed directly by suit
+_SUITS = tuple(SUIT_ICONS[suit] for suit in range(4))
+
 # =========================
 # Game Statistics
 # =========================
@@ -42,17 +177,91 @@ SUIT_ICONS = {
 stats = {"wins": 0, "losses": 0, "ties": 0}
 
 
+# Blackjack value of every rank, indexed directly by rank (index 0 is unused)
+_CARD_VALUE = (0, 11, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+
+
 def get_card_value(rank):
     """
     Converts a card rank into its Blackjack numeric value.
     Ace is treated as 11 points.
     Face cards are worth 10 points.
     """
-    if rank == 1:
-        return 11
-    if rank >= 10:
-        return 10
-    return rank
+    return _CARD_VALUE[rank] if rank < 14 else 10
+
+
+def udp_recv_one(udp):
+    """
+    Receives a single datagram into the reused receive buffer.
+
+    Returns:
+        tuple[memoryview, tuple[str, int]]: (data, address) of the datagram
+    """
+    nbytes, addr = udp.recvfrom_into(_udp_buf)
+    return _udp_mv[:nbytes], addr
+
+
+def udp_recv_batch(udp, n=_BATCH_SIZE):
+    """
+    Receives up to n queued datagrams from a UDP socket in a single syscall.
+    Blocks until at least one datagram is available.
+    Falls back to a single recvfrom_into where recvmmsg is unavailable or fails.
+
+    Datagrams are not copied: each data item is a view into a reused receive
+    buffer and is only valid until the next call.
+
+    Returns:
+        list[tuple[memoryview, tuple[str, int]]]: (data, address) for every datagram
+    """
+    if _recvmmsg is None:
+        return [udp_recv_one(udp)]
+
+    n = min(n, _BATCH_SIZE)
+    for i in range(n):
+        _batch_msgs[i].msg_hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+
+    count = _recvmmsg(udp.fileno(), _batch_msgs, n, _MSG_WAITFORONE, None)
+    if count < 0:
+        return [udp_recv_one(udp)]
+
+    return [
+        (
+            _batch_views[i][:_batch_msgs[i].msg_len],
+            (socket.inet_ntoa(bytes(_batch_addrs[i].sin_addr)), socket.ntohs(_batch_addrs[i].sin_port))
+        )
+        for i in range(count)
+    ]
+
+
+def ask_num_rounds(udp):
+    """
+    Asks the user how many rounds to play, defaulting to 1 on invalid input.
+    The prompt runs on a separate thread while queued offers keep being
+    drained from the UDP socket, so its receive buffer cannot overflow.
+    """
+    answer = []
+
+    def prompt():
+        try:
+            answer.append(int(input("\nHow many rounds would you like to play? ")))
+        except:
+            answer.append(1)
+
+    reader = threading.Thread(target=prompt, daemon=True)
+    reader.start()
+
+    # Discard offers that arrive while the user is answering
+    udp.settimeout(0.1)
+    try:
+        while reader.is_alive():
+            try:
+                udp.recv_into(_udp_buf)
+            except socket.timeout:
+                pass
+    finally:
+        udp.settimeout(None)
+
+    return answer[0]
 
 
 def start_client():
@@ -70,57 +279,75 @@ def start_client():
     # Create a UDP socket to receive broadcast offers
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        # Let several clients on the same machine share the offer port
+        # (SO_REUSEPORT is not available on every platform)
+        try:
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except (AttributeError, OSError):
+            pass
         udp.bind(('0.0.0.0', UDP_PORT))
 
         # Client runs indefinitely and waits for new offers
         while True:
-            data, addr = udp.recvfrom(1024)
-
-            try:
-                # Parse the UDP offer packet
-                magic, m_type, port, srv_name = struct.unpack('!IBH32s', data[:39])
-
-                # Validate packet structure and type
-                if magic == MAGIC_COOKIE and m_type == 0x2:
-                    offered_name = srv_name.split(b'\x00', 1)[0].decode(errors='ignore')
-                    print(f"\nReceived offer from {addr[0]} ({offered_name})")
-
-                    # Ignore offers not matching our team name
-                    if offered_name != TEAM_NAME:
-                        continue
-
-                    # Ask the user how many rounds to play
-                    try:
-                        num_rounds = int(input("\nHow many rounds would you like to play? "))
-                    except:
-                        num_rounds = 1
-
-                    # Reset statistics for the new session
-                    stats["wins"] = 0
-                    stats["losses"] = 0
-                    stats["ties"] = 0
-
-                    # Start the Blackjack game over TCP
-                    play_game(addr[0], port, num_rounds)
-
-                    # ===== Required by assignment =====
-                    # Print summary statistics at the end of the session
-                    win_rate = (stats["wins"] / num_rounds) * 100 if num_rounds > 0 else 0
-                    print(f"\nFinished playing {num_rounds} rounds, win rate: {win_rate:.2f}%")
-                    # =================================
+            # Drain every queued offer in one call
+            for data, addr in udp_recv_batch(udp):
+                try:
+                    # Parse the UDP offer packet
+                    magic, m_type, port, srv_name = _OFFER.unpack_from(data)
+
+                    # Validate packet structure and type
+                    if magic == MAGIC_COOKIE and m_type == 0x2:
+                        # Ignore offers not matching our team name (compared as raw bytes)
+                        raw_name = srv_name.split(b'\x00', 1)[0]
+                        if raw_name != _TEAM_NAME_TRIM:
+                            continue
+
+                        # A matching name is our own team name, so no decoding is needed
+                        print(f"\nReceived offer from {addr[0]} ({TEAM_NAME})")
+
+                        # Ask the user how many rounds to play
+                        num_rounds = ask_num_rounds(udp)
+
+                        # Reset statistics for the new session
+                        stats["wins"] = 0
+                        stats["losses"] = 0
+                        stats["ties"] = 0
+
+                        # Start the Blackjack game over TCP
+                        play_game(addr[0], port, num_rounds)
+
+                        # ===== Required by assignment =====
+                        # Print summary statistics at the end of the session
+                        win_rate = (stats["wins"] / num_rounds) * 100 if num_rounds > 0 else 0
+                        print(f"\nFinished playing {num_rounds} rounds, win rate: {win_rate:.2f}%")
+                        # =================================
+
+                        # Display detailed statistics
+                        print(
+                            f"--- TOTAL STATS: {stats['wins']} Wins, {stats['losses']} Losses, {stats['ties']} Ties ---"
+                        )
+
+                        # Return to listening mode
+                        print("\nReturning to the lobby...")
+                        print("Client started, listening for offer requests...")
+
+                        # The rest of this batch predates the session, so receive fresh offers
+                        break
 
-                    # Display detailed statistics
-                    print(
-                        f"--- TOTAL STATS: {stats['wins']} Wins, {stats['losses']} Losses, {stats['ties']} Ties ---"
-                    )
+                except Exception:
+                    # Ignore malformed or irrelevant packets
+                    continue
 
-                    # Return to listening mode
-                    print("\nReturning to the lobby...")
-                    print("Client started, listening for offer requests...")
 
-            except Exception:
-                # Ignore malformed or irrelevant packets
-                continue
+def flush_output(out):
+    """
+    Writes all buffered console lines with a single write and clears the buffer.
+    """
+    if out:
+        sys.stdout.write("".join(out))
+        sys.stdout.flush()
+        out.clear()
 
 
 def play_game(ip, port, num_rounds):
@@ -128,22 +355,50 @@ def play_game(ip, port, num_rounds):
     Connects to the Blackjack server over TCP and plays the specified number of rounds.
     """
 
+    # Console lines are buffered and written once per prompt or round result
+    out = []
+
+    # Round outcomes are counted locally and added to stats when the session ends
+    wins = losses = ties = 0
+
     try:
+        # Reject malformed addresses before creating or connecting any socket
+        socket.inet_aton(ip)
+
         # Create a TCP socket for the game session
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp:
             tcp.settimeout(10)
+
+            # Disable Nagle's algorithm so small decision packets are sent immediately
+            tcp.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            # Use explicit socket buffer sizes so bursts of dealt cards never stall
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65535)
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65535)
             tcp.connect((ip, port))
 
+            # Once connected, go back to a plain blocking socket and let the kernel
+            # enforce the read timeout, so each recv is a single syscall
+            tcp.settimeout(None)
+            tcp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, _RECV_TIMEOUT)
+
             # Build and send the request packet to start the game
-            request_packet = struct.pack(
-                '!IBB32s',
-                MAGIC_COOKIE,
-                0x3,
-                num_rounds,
-                TEAM_NAME.encode().ljust(32, b'\x00')
-            )
+            request_packet = _REQ.pack(MAGIC_COOKIE, 0x3, num_rounds, _TEAM_NAME_BYTES)
             tcp.sendall(request_packet)
 
+            # Several messages may arrive in a single recv into the shared buffer
+            buf = _RECV_BUF
+            mv = _RECV_MV
+
+            # Offset of the next unparsed message and number of buffered bytes
+            start = 0
+            filled = 0
+
+            # Bind the per-message lookups to locals for the receive loop
+            msg_size = _MSG.size
+            recv_into = tcp.recv_into
+            has_header = buf.startswith
+
             # Play the requested number of rounds
             for r in range(num_rounds):
                 player_sum = 0
@@ -151,77 +406,100 @@ def play_game(ip, port, num_rounds):
 
                 # Each round continues until a result is received
                 while True:
-                    data = b""
-
-                    # Ensure a full message is received
-                    while len(data) < 9:
-                        chunk = tcp.recv(9 - len(data))
-                        if not chunk:
-                            raise ConnectionError("Server closed the connection")
-                        data += chunk
-
-                    # Parse the game message
-                    magic, m_type, res, rank, suit = struct.unpack('!IBB HB', data)
-
-                    # Validate incoming packet
-                    if magic != MAGIC_COOKIE or m_type != 0x4:
+                    # Receive more data only when no full message is buffered
+                    if filled - start < msg_size:
+                        # Move the partial message left over to the front of the buffer
+                        leftover = filled - start
+                        mv[:leftover] = mv[start:filled]
+                        start = 0
+                        filled = leftover
+
+                        while filled < msg_size:
+                            try:
+                                k = recv_into(mv[filled:])
+                            except BlockingIOError:
+                                # SO_RCVTIMEO expired
+                                raise TimeoutError("Server did not respond in time")
+                            if not k:
+                                raise ConnectionError("Server closed the connection")
+                            filled += k
+
+                    offset = start
+                    start += msg_size
+
+                    # Validate incoming packet header before parsing anything else
+                    if not has_header(_MSG_HEADER, offset):
                         continue
 
+                    # Parse the remaining fields straight from the buffer
+                    res = buf[offset + 5]
+                    rank = (buf[offset + 6] << 8) | buf[offset + 7]
+                    suit = buf[offset + 8]
+
                     # Handle card reception
                     if rank > 0:
                         cards_received += 1
-                        name = RANK_NAMES.get(rank, str(rank))
-                        icon = SUIT_ICONS.get(suit % 10, "Unknown")
+                        name = _RANKS[rank] if rank < 14 else str(rank)
+                        icon = _SUITS[suit & 3]
 
                         # First two cards belong to the player
                         if cards_received <= 2:
-                            player_sum += get_card_value(rank)
-                            print(f" YOUR Card: {name} of {icon}")
+                            player_sum += _CARD_VALUE[rank] if rank < 14 else 10
+                            out.append(f" YOUR Card: {name} of {icon}\n")
 
                         # Third card is the dealer's visible card
                         elif cards_received == 3:
-                            print(f" DEALER'S Visible Card: {name} of {icon}")
-                            print(f"💰 Your Starting Total: {player_sum}")
+                            out.append(f" DEALER'S Visible Card: {name} of {icon}\n")
+                            out.append(f"💰 Your Starting Total: {player_sum}\n")
 
                         # Additional cards go to the player
                         else:
-                            player_sum += get_card_value(rank)
-                            print(f"New Card for YOU: {name} of {icon}")
-                            print(f"💰 Updated Total: {player_sum}")
+                            player_sum += _CARD_VALUE[rank] if rank < 14 else 10
+                            out.append(f"New Card for YOU: {name} of {icon}\n")
+                            out.append(f"💰 Updated Total: {player_sum}\n")
 
                     # Player decision phase
                     if res == 0 and rank == 0:
-                        print(f"\n--- YOUR TURN (Total: {player_sum}) ---")
+                        out.append(f"\n--- YOUR TURN (Total: {player_sum}) ---\n")
+
+                        # Make everything visible before prompting the player
+                        flush_output(out)
 
                         # Ask player for action until valid input is provided
                         while True:
-                            choice = input(" Hit (h) or Stand (s)? ").lower().strip()
-                            if choice in ['h', 's']:
+                            choice = input(" Hit (h), auto-hit up to N cards (h2-h9) or Stand (s)? ").lower().strip()
+                            if choice in _DECISION_PKTS:
                                 break
-                            print(" Invalid input! Type 'h' or 's'.")
+                            print(" Invalid input! Type 'h', 'h2'-'h9' or 's'.")
 
                         # Send player's decision to the server
-                        msg = "Hittt" if choice == 'h' else "Stand"
-                        tcp.sendall(struct.pack('!IB5s', MAGIC_COOKIE, 0x4, msg.encode()))
+                        tcp.sendall(_DECISION_PKTS[choice])
 
                     # End-of-round result received
                     elif res != 0:
-                        outcomes = {1: "TIE", 2: "LOSS", 3: "WIN"}
-                        print(f"\n🏁 Result: {outcomes.get(res, 'Round Over')}")
+                        outcome = _OUTCOMES[res] if res <= 3 else _OUTCOMES[0]
+                        out.append(f"\n🏁 Result: {outcome}\n")
+                        flush_output(out)
 
                         # Update statistics
                         if res == 1:
-                            stats["ties"] += 1
+                            ties += 1
                         elif res == 2:
-                            stats["losses"] += 1
+                            losses += 1
                         elif res == 3:
-                            stats["wins"] += 1
+                            wins += 1
                         break
 
     except Exception as e:
         # Handle network errors and unexpected disconnections
+        flush_output(out)
         print(f" Error: {e}")
 
+    # Record the session results, including rounds finished before any error
+    stats["wins"] += wins
+    stats["losses"] += losses
+    stats["ties"] += ties
+
 
 if __name__ == "__main__":
     # Entry point of the client application
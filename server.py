@@ -1,8 +1,16 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import logging.handlers
+import os
+import queue
 import socket
 import struct
-import time
-import threading
 import random
+import sys
+import threading
+import time
 
 # =========================
 # Protocol Constants
@@ -20,147 +28,228 @@ TCP_PORT = 0
 # Team name advertised to clients
 TEAM_NAME = "badaboom_sapir_batel"
 
+# Minimum level of server log output (logging.WARNING silences per-round messages)
+LOG_LEVEL = logging.INFO
+
+# Server log; see setup_logging for where its output goes
+log = logging.getLogger("blackjack")
+
+# Maximum number of concurrent client sessions; further connections are closed
+MAX_SESSIONS = 256
+
+# CPU the offer broadcaster is pinned to, e.g. the one handling the NIC queue
+# (None lets the OS schedule it anywhere)
+BROADCAST_CPU = None
+
+# =========================
+# Packet Formats
+# =========================
+
+# Pre-compiled packet layouts, so the format strings are parsed only once
+
+# Offer: magic cookie | message type | TCP port | team name
+_OFFER = struct.Struct('!IBH32s')
+
+# Request: magic cookie | message type | number of rounds | team name
+_REQ = struct.Struct('!IBB32s')
+
+# Server payload: magic cookie | message type | round result | card rank | card suit
+_PAYLOAD = struct.Struct('!IBBHB')
+
+# Three server payloads back to back, used for the initial deal
+_DEAL = struct.Struct('!' + 'IBBHB' * 3)
+
+# Client payload: magic cookie | message type | decision
+_DECISION = struct.Struct('!IB5s')
+
+# Fixed frames, packed once up front
+_TURN_PROMPT = _PAYLOAD.pack(MAGIC_COOKIE, 0x4, 0, 0, 0)
+
+# Round result frames, indexed directly by result code (index 0 is unused)
+_RESULT_FRAMES = tuple(_PAYLOAD.pack(MAGIC_COOKIE, 0x4, res, 0, 0) for res in range(4))
+
+# Blackjack value of every rank, indexed directly by rank (index 0 is unused):
+# Ace counts as 11, face cards count as 10, other cards count as their rank
+_CARD_VALUE = (0, 11, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10)
+
+# Bound once, since it is the only random source used per card
+_getrandbits = random.getrandbits
+
 
 def get_card():
     """
     Generates and returns a random playing card.
 
+    A single 6-bit draw selects one of the 52 cards; draws of 52..63 are
+    rejected and redrawn so every card stays equally likely.
+
     Returns:
-        tuple[int, int]:
+        tuple[int, int, int]:
             - rank: integer in range [1..13]
             - suit: integer in range [0..3]
+            - value: Blackjack value of the card (Ace 11, face cards 10)
     """
-    return random.randint(1, 13), random.randint(0, 3)
+    card = _getrandbits(6)
+    while card >= 52:
+        card = _getrandbits(6)
+    rank = card % 13 + 1
+    return rank, card // 13, _CARD_VALUE[rank]
 
 
-def card_value(rank):
-    """
-    Converts a card rank into its Blackjack numeric value.
+# timerfd(2) constants
+_CLOCK_MONOTONIC = 1
+_TFD_CLOEXEC = 0o2000000
 
-    Rules:
-        - Ace (rank 1) counts as 11
-        - Face cards (10, 11, 12, 13) count as 10
-        - Other cards count as their rank
 
-    Args:
-        rank (int): Card rank in range [1..13]
+class _TimeSpec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
 
-    Returns:
-        int: Blackjack value of the card
+
+class _ITimerSpec(ctypes.Structure):
+    _fields_ = [("it_interval", _TimeSpec), ("it_value", _TimeSpec)]
+
+
+def create_interval_timer(seconds):
     """
-    if rank == 1:
-        return 11
-    if rank >= 10:
-        return 10
-    return rank
+    Creates a Linux timerfd that expires every given number of seconds.
+    Each expiry makes the descriptor readable; reading it waits for the next one.
 
+    Args:
+        seconds (int): timer period in whole seconds
 
-def handle_client(conn, addr):
+    Returns:
+        int | None: the timer file descriptor, or None where timerfd is unavailable
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.timerfd_create(_CLOCK_MONOTONIC, _TFD_CLOEXEC)
+        if fd < 0:
+            return None
+        period = _TimeSpec(seconds, 0)
+        if libc.timerfd_settime(fd, 0, ctypes.byref(_ITimerSpec(period, period)), None) < 0:
+            os.close(fd)
+            return None
+    except (OSError, AttributeError):
+        return None
+    return fd
+
+
+async def handle_client(reader, writer):
     """
     Handles a single connected TCP client.
     Runs a full Blackjack session consisting of multiple rounds.
     """
+    addr = writer.get_extra_info('peername')
+
+    # Flush small frames immediately instead of letting Nagle's algorithm hold them
+    writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Outgoing frames are gathered here and written together at each boundary
+    out = []
+
+    # Bind the names used for every card and frame to locals for the session loop
+    pack = _PAYLOAD.pack
+    mc = MAGIC_COOKIE
+    draw = get_card
+    queue_frame = out.append
+    info = log.info
     try:
-        # Set timeout to prevent blocking forever on disconnected clients
-        conn.settimeout(10.0)
-
-        # Read the fixed-size request packet safely
-        # TCP does not guarantee receiving the full packet in one recv call
-        data = b""
-        while len(data) < 38:
-            try:
-                chunk = conn.recv(38 - len(data))
-            except socket.timeout:
-                # Client might still be choosing number of rounds
-                continue
-            if not chunk:
-                return
-            data += chunk
+        # Read the fixed-size request packet
+        # (the client might still be choosing the number of rounds)
+        data = await reader.readexactly(_REQ.size)
 
         # Unpack the request packet:
         # magic cookie | message type | number of rounds | team name
-        magic, m_type, rounds, name = struct.unpack('!IBB32s', data[:38])
+        magic, m_type, rounds, name = _REQ.unpack_from(data, 0)
 
         # Validate protocol fields
         if magic != MAGIC_COOKIE or m_type != 0x3:
             return
 
-        # Extract team name from null-padded byte field
-        client_team = name.decode().strip('\x00')
-        print(f"Starting {rounds} rounds with team: {client_team}")
+        # Extract team name from null-padded byte field, decoding only up to the first NUL
+        end = name.find(b'\x00')
+        client_team = (name if end < 0 else name[:end]).decode(errors='replace')
+        info("Starting %d rounds with team: %s", rounds, client_team)
 
         # Run the requested number of rounds
         for r in range(rounds):
-            print(f"\n--- Round {r + 1} started ---")
+            info("\n--- Round %d started ---", r + 1)
 
             # Deal initial cards
-            player_cards = [get_card(), get_card()]
-            dealer_cards = [get_card(), get_card()]
-            print("Dealing initial cards")
-
-            # Send player's initial two cards
-            for rank, suit in player_cards:
-                conn.sendall(struct.pack('!IBB HB', MAGIC_COOKIE, 0x4, 0, rank, suit))
-                time.sleep(0.1)
-
-            # Send dealer's visible card only
-            conn.sendall(
-                struct.pack('!IBB HB', MAGIC_COOKIE, 0x4, 0, dealer_cards[0][0], dealer_cards[0][1])
+            player_cards = [draw(), draw()]
+            dealer_cards = [draw(), draw()]
+            info("Dealing initial cards")
+
+            # Running hand totals, updated as cards are drawn
+            p_sum = player_cards[0][2] + player_cards[1][2]
+            d_sum = dealer_cards[0][2] + dealer_cards[1][2]
+
+            # Queue player's initial two cards and the dealer's visible card as one frame
+            queue_frame(
+                _DEAL.pack(
+                    mc, 0x4, 0, player_cards[0][0], player_cards[0][1],
+                    mc, 0x4, 0, player_cards[1][0], player_cards[1][1],
+                    mc, 0x4, 0, dealer_cards[0][0], dealer_cards[0][1]
+                )
             )
 
             # Player decision loop
             while True:
-                # Calculate player's current total
-                p_sum = sum(card_value(c[0]) for c in player_cards)
-
                 # Player bust condition
                 if p_sum > 21:
-                    print("Player busts")
+                    info("Player busts")
                     break
 
-                # Notify client it's their turn
-                conn.sendall(struct.pack('!IBB HB', MAGIC_COOKIE, 0x4, 0, 0, 0))
+                # At 21 hitting can only hurt, so stand without prompting the client
+                if p_sum == 21:
+                    info("Player has 21, standing")
+                    break
+
+                # Notify client it's their turn, together with any queued cards
+                queue_frame(_TURN_PROMPT)
+                writer.writelines(out)
+                out.clear()
+                await writer.drain()
 
                 # Receive player's decision (Hit / Stand)
-                decision_data = b""
-                while len(decision_data) < 10:
-                    try:
-                        chunk = conn.recv(10 - len(decision_data))
-                    except socket.timeout:
-                        continue
-                    if not chunk:
-                        return
-                    decision_data += chunk
-
-                magic2, m_type2, decision = struct.unpack('!IB5s', decision_data)
+                decision_data = await reader.readexactly(_DECISION.size)
+
+                magic2, m_type2, decision = _DECISION.unpack(decision_data)
 
                 # Validate decision packet
-                if magic2 != MAGIC_COOKIE or m_type2 != 0x4:
+                if magic2 != mc or m_type2 != 0x4:
                     continue
 
                 # Handle player action
                 if decision == b"Hittt":
-                    print("Player chose HIT")
-                    new_c = get_card()
+                    info("Player chose HIT")
+                    new_c = draw()
                     player_cards.append(new_c)
-                    conn.sendall(
-                        struct.pack('!IBB HB', MAGIC_COOKIE, 0x4, 0, new_c[0], new_c[1])
-                    )
-                    time.sleep(0.1)
+                    p_sum += new_c[2]
+                    queue_frame(pack(mc, 0x4, 0, new_c[0], new_c[1]))
+                elif decision[:1] == b"H" and decision[1:2].isdigit():
+                    # Auto-hit: deal up to N cards at once, stopping once the hand reaches 17
+                    hits = int(decision[1:2])
+                    info("Player chose AUTO-HIT (up to %d cards)", hits)
+                    for _ in range(hits):
+                        new_c = draw()
+                        player_cards.append(new_c)
+                        p_sum += new_c[2]
+                        queue_frame(pack(mc, 0x4, 0, new_c[0], new_c[1]))
+                        if p_sum >= 17:
+                            break
                 else:
-                    print("Player chose STAND")
+                    info("Player chose STAND")
                     break
 
-            # Calculate final sums
-            p_sum = sum(card_value(c[0]) for c in player_cards)
-            d_sum = sum(card_value(c[0]) for c in dealer_cards)
-
             # Dealer draws until reaching at least 17
             if p_sum <= 21:
                 while d_sum < 17:
-                    new_c = get_card()
+                    new_c = draw()
                     dealer_cards.append(new_c)
-                    d_sum = sum(card_value(c[0]) for c in dealer_cards)
+                    d_sum += new_c[2]
 
             # Determine round result
             res = 0x1  # Default: TIE
@@ -172,21 +261,161 @@ def handle_client(conn, addr):
                 res = 0x2  # Player loss
 
             outcome = {1: "TIE", 2: "LOSS", 3: "WIN"}
-            print(f"Round {r + 1} result: {outcome[res]}")
+            info("Round %d result: %s", r + 1, outcome[res])
+
+            # Send round result to the client, together with any queued cards
+            queue_frame(_RESULT_FRAMES[res])
+            writer.writelines(out)
+            out.clear()
+            await writer.drain()
 
-            # Send round result to the client
-            conn.sendall(struct.pack('!IBB HB', MAGIC_COOKIE, 0x4, res, 0, 0))
-            time.sleep(0.5)
+        info("Finished session with %s", client_team)
 
-        print(f"Finished session with {client_team}")
+    except asyncio.IncompleteReadError:
+        # Client disconnected in the middle of a packet
+        return
 
     except Exception as e:
         # Catch and log unexpected session errors
-        print(f"Session error with {addr}: {e}")
+        log.error("Session error with %s: %s", addr, e)
 
     finally:
         # Ensure the connection is always closed
-        conn.close()
+        writer.close()
+
+
+# Free session slots, shared by the event loops of every listener
+_session_slots = threading.BoundedSemaphore(MAX_SESSIONS)
+
+
+async def admit_client(reader, writer):
+    """
+    Runs a session for a newly accepted client, or closes the connection
+    right away when MAX_SESSIONS sessions are already running.
+    """
+    if not _session_slots.acquire(blocking=False):
+        log.warning("Server full, rejecting %s", writer.get_extra_info('peername'))
+        writer.close()
+        return
+
+    try:
+        await handle_client(reader, writer)
+    finally:
+        _session_slots.release()
+
+
+def broadcast(tcp_port):
+    """
+    Periodically broadcasts server offers via UDP.
+    """
+    # Pin this thread so broadcasts stay on the configured CPU
+    if BROADCAST_CPU is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {BROADCAST_CPU})
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+        # Large enough that sending an offer never has to wait for buffer space
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+
+        # Offer packet structure:
+        # magic cookie | message type | TCP port | team name
+        packet = _OFFER.pack(MAGIC_COOKIE, 0x2, tcp_port, TEAM_NAME.encode().ljust(32, b'\x00'))
+
+        # Never block on a send; a skipped beacon is simply retried a second later
+        flags = getattr(socket, "MSG_DONTWAIT", 0)
+
+        # Broadcast on a fixed 1 second grid so the beacon does not drift:
+        # a kernel timerfd where available, otherwise sleeps anchored to the monotonic clock
+        timer = create_interval_timer(1)
+        next_tick = time.monotonic()
+        try:
+            while True:
+                try:
+                    udp.sendto(packet, flags, ('255.255.255.255', UDP_PORT))
+                except OSError:
+                    pass
+
+                if timer is not None:
+                    os.read(timer, 8)
+                else:
+                    next_tick += 1
+                    time.sleep(max(0.0, next_tick - time.monotonic()))
+        finally:
+            if timer is not None:
+                os.close(timer)
+
+
+async def accept_sessions(tcp):
+    """
+    Serves every client session accepted on a single listening socket.
+    """
+    server = await asyncio.start_server(admit_client, sock=tcp)
+
+    # Accept incoming TCP connections indefinitely
+    async with server:
+        await server.serve_forever()
+
+
+def create_listener(port):
+    """
+    Creates a TCP listening socket.
+    Where supported, SO_REUSEPORT lets several listeners share the same port,
+    with the kernel spreading incoming connections across their accept queues.
+
+    Args:
+        port (int): TCP port to bind (0 lets the OS choose one)
+
+    Returns:
+        socket.socket: the listening socket
+    """
+    # An explicit IPPROTO_TCP carries over to accepted sockets, so asyncio also
+    # enables TCP_NODELAY on them right after accept
+    tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    # Larger socket buffers, inherited by every accepted connection
+    # (the receive buffer must be sized before listen() to affect window scaling)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 262144)
+    tcp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 262144)
+    tcp.bind(('', port))
+    tcp.listen(128)
+    return tcp
+
+
+def setup_logging():
+    """
+    Sends server log output through a queue to a background writer thread,
+    so sessions never block on the console.
+    """
+    records = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(LOG_LEVEL)
+    log.propagate = False
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    logging.handlers.QueueListener(records, console).start()
+
+
+def get_server_ip():
+    """
+    Finds the IP address of the interface used for outgoing traffic.
+    Connecting a UDP socket only selects a route, so no packet is sent
+    and no DNS lookup is made.
+
+    Returns:
+        str: the local IP address, or 127.0.0.1 when there is no route
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(('8.8.8.8', 80))
+            return s.getsockname()[0]
+        except OSError:
+            return '127.0.0.1'
 
 
 def start_server():
@@ -194,51 +423,33 @@ def start_server():
     Starts the Blackjack server.
     Listens for TCP connections and broadcasts UDP offers.
     """
-    server_ip = socket.gethostbyname(socket.gethostname())
-    print(f"Server started, listening on IP address {server_ip}")
-
-    # Create TCP server socket
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as tcp:
-        tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        tcp.bind(('', TCP_PORT))
-        tcp.listen(5)
-
-        # Retrieve the actual TCP port assigned by the OS
-        actual_port = tcp.getsockname()[1]
-
-        def broadcast():
-            """
-            Periodically broadcasts server offers via UDP.
-            """
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
-                udp.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
-                # Offer packet structure:
-                # magic cookie | message type | TCP port | team name
-                packet = struct.pack(
-                    '!IBH32s',
-                    MAGIC_COOKIE, 
-                    0x2,
-                    actual_port,
-                    TEAM_NAME.encode().ljust(32, b'\x00')
-                )
+    setup_logging()
+
+    server_ip = get_server_ip()
+    log.info("Server started, listening on IP address %s", server_ip)
 
-                while True:
-                    udp.sendto(packet, ('255.255.255.255', UDP_PORT))
-                    time.sleep(1)
+    # Create the main TCP listener; the OS picks the port
+    tcp = create_listener(TCP_PORT)
 
-        # Start UDP broadcast thread
-        threading.Thread(target=broadcast, daemon=True).start()
+    # Retrieve the actual TCP port assigned by the OS
+    actual_port = tcp.getsockname()[1]
 
-        # Accept incoming TCP connections indefinitely
-        while True:
-            conn, addr = tcp.accept()
+    # Start UDP broadcasting on its own thread, paced by a 1 second timer
+    threading.Thread(target=broadcast, args=(actual_port,), daemon=True).start()
+
+    # One extra listener per remaining CPU, all sharing the same port
+    if hasattr(socket, "SO_REUSEPORT"):
+        for _ in range((os.cpu_count() or 1) - 1):
+            # Each extra listener runs its own event loop on a worker thread
             threading.Thread(
-                target=handle_client,
-                args=(conn, addr),
+                target=asyncio.run,
+                args=(accept_sessions(create_listener(actual_port)),),
                 daemon=True
             ).start()
 
+    # Run the main listener on this thread's event loop
+    asyncio.run(accept_sessions(tcp))
+
 
 if __name__ == "__main__":
     # Server entry point